@@ -5,14 +5,22 @@
 
 import time
 import json
-import urllib.request
-import urllib.error
 import urllib.parse
 import random
 import re
 import os
 import sys
+import shutil
+import shelve
+import hashlib
+import zipfile
+import codecs
+import html
 import datetime
+import logging
+import unicodedata
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # Selenium Imports
 try:
@@ -22,32 +30,199 @@ try:
     from selenium.webdriver.support.ui import WebDriverWait
     from selenium.webdriver.support import expected_conditions as EC
     from selenium.webdriver.common.keys import Keys
-    from selenium.common.exceptions import TimeoutException, NoSuchElementException, StaleElementReferenceException, ElementClickInterceptedException
+    from selenium.common.exceptions import TimeoutException, StaleElementReferenceException, ElementClickInterceptedException
     webdriver_available = True
 except ImportError:
     print("Error: Selenium library not found. Please install it with 'pip install selenium'")
     sys.exit(1)
 
+# HTTP Imports
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+except ImportError:
+    print("Error: Requests library not found. Please install it with 'pip install requests'")
+    sys.exit(1)
+
 # Other Library Imports
 try:
-    import docx
-    docx_available = True
+    import regex
+    _GRAPHEME_RE = regex.compile(r"\X")
+    # Emoji sequences (ZWJ families, flags, skin tones, keycaps) count as 2 however many code points they hold.
+    _EMOJI_RE = regex.compile(r"[\p{Extended_Pictographic}\p{Regional_Indicator}\uFE0F]")
+    regex_available = True
 except ImportError:
-    docx_available = False
+    regex_available = False
+
+try:
+    import ijson
+    ijson_available = True
+except ImportError:
+    ijson_available = False
+
+
+# Log lines keep the agent's own level tags (INFO, SUCCESS, HEAD, ...) via the `tag` extra.
+_log_handler = logging.StreamHandler(sys.stdout)
+_log_handler.setFormatter(logging.Formatter("%(asctime)s [%(tag)s] - %(message)s", datefmt="%Y-%m-%d %H:%M:%S"))
+logger = logging.getLogger("twitter_agent")
+logger.addHandler(_log_handler)
+logger.setLevel(logging.INFO)
+logger.propagate = False
+_LOG_LEVELS = {"ERROR": logging.ERROR, "WARN": logging.WARNING}
+
+_CODE_FENCE_RE = re.compile(r"```(?:json)?")
+# Tokens of word/document.xml that python-docx's paragraph text is built from: text runs, the run-level
+# tab/break elements, paragraph ends, and table/text-box boundaries (whose content doc.paragraphs leaves out).
+_DOCX_TOKEN_RE = re.compile(
+    r"<w:t(?:\s[^>]*)?>(?P<text>[^<]*)</w:t>"
+    r"|<(?P<close>/?)w:(?:tbl|txbxContent)(?:\s[^>]*)?>"
+    r"|(?P<tag></w:p>|<w:tab/>|<w:ptab\s[^>]*/>|<w:cr/>|<w:noBreakHyphen/>|<w:br(?:\s[^>]*)?/>)"
+)
+_DOCX_TAG_TEXT = {'</w:p>': '\n', '<w:tab/>': '\t', '<w:cr/>': '\n', '<w:noBreakHyphen/>': '-'}
+# Code points X counts as one character; everything else (CJK, emoji, ...) counts as two.
+_LIGHT_CHAR_RANGES = ((0, 4351), (8192, 8205), (8208, 8223), (8242, 8247))
+
+
+def _code_point_weight(char):
+    code = ord(char)
+    return 1 if any(low <= code <= high for low, high in _LIGHT_CHAR_RANGES) else 2
+
+
+def _weighted_clusters(text):
+    """Yields (cluster, weight) pairs for NFC-normalized text, weighted the way X counts characters."""
+    text = unicodedata.normalize('NFC', text)
+    for cluster in (_GRAPHEME_RE.findall(text) if regex_available else text):
+        if len(cluster) > 1 and _EMOJI_RE.search(cluster): yield cluster, 2; continue
+        # Everything else (Thai, Indic conjuncts, stacked diacritics) is counted code point by code point.
+        yield cluster, sum(_code_point_weight(char) for char in cluster)
+
+
+def _weighted_len(text):
+    """Approximates X's weighted character count for the tweet length limit."""
+    return sum(weight for _, weight in _weighted_clusters(text))
+
+
+def _weighted_prefix(text, budget):
+    """Returns the longest (NFC-normalized) prefix of text whose weighted length fits in budget."""
+    parts, length = [], 0
+    for cluster, weight in _weighted_clusters(text):
+        if length + weight > budget: break
+        parts.append(cluster); length += weight
+    return ''.join(parts)
+
+
+class _TokenBucket:
+    """Client-side rate limiter: acquire() blocks until a request may be sent."""
+
+    def __init__(self, rate, burst):
+        self.base_rate = rate
+        self.rate = rate
+        self.rate_until = 0.0  # Monotonic time at which a header-derived rate expires.
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if now >= self.rate_until: self.rate = self.base_rate
+            # Reserve the token now and sleep outside the lock; later callers queue behind the negative balance.
+            wait_time = (1 - self.tokens) / self.rate if self.tokens < 1 else 0
+            self.tokens -= 1
+        if wait_time: time.sleep(wait_time)
+
+    def update_from_headers(self, headers):
+        # Follow the server's advertised budget for the current window, never exceeding the configured rate.
+        try:
+            remaining = int(headers['X-RateLimit-Remaining'])
+            reset = float(headers['X-RateLimit-Reset'])
+        except (KeyError, TypeError, ValueError):
+            return
+        if reset > time.time(): reset -= time.time()  # Epoch timestamp rather than seconds-until-reset.
+        if reset <= 0: return
+        with self.lock:
+            self.rate = min(self.base_rate, max(remaining, 1) / reset)
+            self.rate_until = time.monotonic() + reset
+            if remaining <= 0: self.tokens = min(self.tokens, 0)
 
 
 class HeadlessTwitterAgent:
     TWITTER_CHAR_LIMIT = 280
+    COOKIES_FILE = "twitter_cookies.json"
+    AI_CACHE_FILE = "ai_cache.db"
+    # Resources skipped on read-only scrapes (trends, search); the composer still loads everything.
+    SCRAPE_BLOCKED_URLS = ['*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.mp4', '*.woff', '*.woff2', '*analytics*', '*doubleclick*']
+    AI_CACHE_TTL = 30 * 60  # Seconds
+    AI_CACHE_MAX_ENTRIES = 256
+    LOCAL_TRUNCATE_LIMIT = int(TWITTER_CHAR_LIMIT * 1.15)  # Marginally-long text is trimmed locally, not summarized.
+    GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent"
+
+    # Prompt templates
+    _MASTER_TPL = "**Persona:** You are a '{p}' expert in '{n}'.\n**Your Recent Activity:**\n{h}\n**TASK:** {t}\n**Output Format (Strictly JSON):**\n```json\n{{\n  {o}\n}}\n```"
+    _POST_OUTPUT = '"analysis": "A brief summary.", "tweet_text": "The final tweet text."'
+    _REPLY_OUTPUT = '"analysis": "Justification for your reply.", "tweet_text": "The reply text. DO NOT use @ mentions."'
+
+    # Locators
+    USER_INPUT = (By.CSS_SELECTOR, "input[name='text']")
+    NEXT_BTN = (By.XPATH, "//button[.//span[text()='Next']]")  # Matched by label text, which CSS cannot express.
+    PASSWORD_INPUT = (By.CSS_SELECTOR, "input[name='password']")
+    LOGIN_BTN = (By.CSS_SELECTOR, "div[data-testid='LoginForm_Login_Button']")
+    PRIMARY_COLUMN = (By.CSS_SELECTOR, "div[data-testid='primaryColumn']")
+    TREND = (By.CSS_SELECTOR, "div[data-testid='trend']")
+    TWEET_TEXTAREA = (By.CSS_SELECTOR, "div[data-testid='tweetTextarea_0']")
+    FILE_INPUT = (By.CSS_SELECTOR, "input[data-testid='fileInput']")
+    ATTACHMENT_IMG = (By.CSS_SELECTOR, "div[data-testid='attachments'] img")
+    TWEET_BTN = (By.CSS_SELECTOR, "button[data-testid='tweetButton']")
+    REPLY_BTN = (By.CSS_SELECTOR, "article[data-testid='tweet'] button[data-testid='reply']")  # find_element returns the first match.
+    ARTICLE = (By.CSS_SELECTOR, "article[data-testid='tweet']")
+
+    # In-page scripts (one WebDriver round-trip instead of one per element)
+    TRENDS_JS = "return Array.from(document.querySelectorAll(\"div[data-testid='trend']\")).map(e => e.innerText).filter(Boolean);"
+    TWEETS_JS = """
+        return Array.from(document.querySelectorAll("article[data-testid='tweet']")).slice(0, 20).filter(a => !/promoted/i.test(a.innerText)).map(a => {
+            const u = Array.from(a.querySelectorAll("div[data-testid='User-Name'] span")).find(s => s.textContent.includes('@'));
+            const t = a.querySelector("div[data-testid='tweetText']");
+            const l = a.querySelector("a[href*='/status/']");
+            return u && t && l ? {author: u.innerText.replace(/^@+|@+$/g, ''), text: t.innerText, url: l.href} : null;
+        }).filter(Boolean);
+    """
 
     def __init__(self, config, secrets):
         self.config = config
+        self.mode = config.get("action_mode", "strategic_mix")
+        self.niche = config.get("niche", "")
+        self.tone = config.get("tone", "Thought Leader")
+        self.required_text = config.get("required_text")
+        self.attach_image = bool(config.get("attach_image", False))
+        self.auto_niche = bool(config.get("auto_niche", False))
+        self.word_file_path = config.get("word_file_path")
         self.secrets = secrets
         self.driver = None
+        self.wait = None
         self.tweet_history = []
+        self.http = self._create_http_session()
+        # API keys travel in headers, never the URL, so they can't leak into logged exception messages.
+        self._gemini_headers = {'x-goog-api-key': secrets.get('GEMINI_API_KEY') or ''}
+        self._news_headers = {'X-Api-Key': secrets.get('NEWSAPI_KEY') or ''}
+        self._ai_cache_lock = threading.Lock()
+        self.gemini_bucket = _TokenBucket(rate=15 / 60, burst=3)
+        self.news_bucket = _TokenBucket(rate=1, burst=2)
         self._log_message("Headless agent initialized.")
 
     def _log_message(self, message, level="INFO"):
-        print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} [{level}] - {message}")
+        logger.log(_LOG_LEVELS.get(level, logging.INFO), message, extra={'tag': level})
+
+    def _create_http_session(self):
+        # One pooled keep-alive session for Gemini, NewsAPI and image downloads.
+        session = requests.Session()
+        session.headers.update({'User-Agent': 'Mozilla/5.0'})
+        retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504], allowed_methods=None)
+        session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry))
+        return session
 
     def _setup_driver(self):
         self._log_message("Setting up headless browser...")
@@ -59,70 +234,109 @@ class HeadlessTwitterAgent:
         try:
             # On GitHub Actions, the driver is usually in the system PATH
             self.driver = webdriver.Edge(options=options)
+            self.wait = WebDriverWait(self.driver, 20)
             self._log_message("Headless browser started successfully.")
-            return True
         except Exception as e:
             self._log_message(f"CRITICAL: Could not start headless browser: {e}", "ERROR")
             return False
+        try: self.driver.execute_cdp_cmd('Network.enable', {})
+        except Exception as e: self._log_message(f"Could not enable CDP network domain, resource blocking disabled: {e}", "WARN")
+        return True
 
     def _login_to_twitter(self):
         self._log_message("Attempting to log in to X.com...")
         try:
             self.driver.get("https://x.com/login")
-            wait = WebDriverWait(self.driver, 20)
             
             # Step 1: Enter username
             self._log_message("Waiting for username/email input field...")
-            user_input = wait.until(EC.presence_of_element_located((By.XPATH, "//input[@name='text']")))
+            user_input = self.wait.until(EC.presence_of_element_located(self.USER_INPUT))
             self._log_message("Entering username...")
             user_input.send_keys(self.secrets['TWITTER_USERNAME'])
-            time.sleep(0.5) # Human-like pause
             
             # Step 2: Click the "Next" button
             self._log_message("Finding and clicking 'Next' button...")
-            next_button = wait.until(EC.element_to_be_clickable((By.XPATH, "//button[.//span[text()='Next']]")))
+            next_button = self.wait.until(EC.element_to_be_clickable(self.NEXT_BTN))
             next_button.click()
             
             # Step 3: Enter password
             self._log_message("Waiting for password input field...")
-            pass_input = wait.until(EC.presence_of_element_located((By.XPATH, "//input[@name='password']")))
+            pass_input = self.wait.until(EC.presence_of_element_located(self.PASSWORD_INPUT))
             self._log_message("Entering password...")
             pass_input.send_keys(self.secrets['TWITTER_PASSWORD'])
-            time.sleep(0.5) # Human-like pause
             
             # Step 4: Click the "Log in" button
             self._log_message("Finding and clicking 'Log in' button...")
-            login_button = wait.until(EC.element_to_be_clickable((By.XPATH, "//div[@data-testid='LoginForm_Login_Button']")))
+            login_button = self.wait.until(EC.element_to_be_clickable(self.LOGIN_BTN))
             login_button.click()
 
             # Step 5: Verify login by waiting for the home timeline
             self._log_message("Waiting for home feed to load...")
-            wait.until(EC.presence_of_element_located((By.XPATH, "//div[@data-testid='primaryColumn']")))
+            self.wait.until(EC.presence_of_element_located(self.PRIMARY_COLUMN))
             self._log_message("Login successful.", "SUCCESS")
+            self._save_cookies()
             return True
         except Exception as e:
             self._log_message(f"Login failed: {e}", "ERROR")
             self.driver.save_screenshot("login_error.png")
             return False
 
+    def _save_cookies(self):
+        try:
+            with open(self.COOKIES_FILE, 'w') as f: json.dump(self.driver.get_cookies(), f)
+        except Exception as e: self._log_message(f"Could not save session cookies: {e}", "WARN")
+
+    def _restore_cookies(self):
+        if not os.path.exists(self.COOKIES_FILE): return False
+        try:
+            with open(self.COOKIES_FILE, 'r') as f: cookies = json.load(f)
+            self.driver.get("https://x.com")
+            for cookie in cookies: self.driver.add_cookie(cookie)
+            return True
+        except Exception as e: self._log_message(f"Could not restore session cookies: {e}", "WARN")
+        return False
+
+    def _is_logged_in(self):
+        try:
+            self.driver.get("https://x.com/home")
+            WebDriverWait(self.driver, 10).until(EC.presence_of_element_located(self.PRIMARY_COLUMN))
+            return self.driver.current_url.startswith("https://x.com/home")
+        except TimeoutException:
+            return False
+
+    def _ensure_session(self):
+        """Reuses the running browser if it is still logged in; otherwise starts one and logs in."""
+        if self.driver:
+            try:
+                if self._is_logged_in(): return True
+            except Exception as e:
+                self._log_message(f"Browser session is no longer usable, restarting: {e}", "WARN")
+                self._shutdown_browser()
+        if not self.driver:
+            if not self._setup_driver(): return False
+            try:
+                if self._restore_cookies() and self._is_logged_in():
+                    self._log_message("Restored previous session from cookies.", "SUCCESS")
+                    return True
+            except Exception as e:
+                self._log_message(f"Could not reuse saved session, logging in instead: {e}", "WARN")
+        return self._login_to_twitter()
+
     def run_action_cycle(self):
-        """Performs a single action cycle: post or reply."""
-        if not self._setup_driver(): return
-        
-        if self._login_to_twitter():
-            self._log_message("--- New Action Cycle ---", "HEAD")
-            mode = self.config.get("action_mode", "strategic_mix")
-            
-            action_type = 'post'
-            if mode == 'strategic_mix': action_type = 'reply' if random.random() < 0.40 else 'post'
-            elif mode == 'reply_only': action_type = 'reply'
+        """Performs a single action cycle: post or reply. The browser is kept open for the next cycle."""
+        if not self._ensure_session(): return
 
-            if action_type == 'reply':
-                self.perform_reply_action()
-            else:
-                self.perform_post_action(mode)
+        self._log_message("--- New Action Cycle ---", "HEAD")
+        mode = self.mode
         
-        self._shutdown_browser()
+        action_type = 'post'
+        if mode == 'strategic_mix': action_type = 'reply' if random.random() < 0.40 else 'post'
+        elif mode == 'reply_only': action_type = 'reply'
+
+        if action_type == 'reply':
+            self.perform_reply_action()
+        else:
+            self.perform_post_action(mode)
 
     def perform_post_action(self, mode):
         generation_function = self._get_generation_function(mode)
@@ -132,14 +346,19 @@ class HeadlessTwitterAgent:
         
         text = content_package.get("text")
         if text:
-            text = self._truncate_or_summarize(text)
             image_path = None
-            if self.config.get("attach_image", False):
+            if self.attach_image:
+                # Summarization (Gemini) and the image hunt (NewsAPI + download) are independent, so overlap them.
                 image_query = content_package.get("query_for_image", text)
-                image_path = self._get_image_from_newsapi(image_query)
+                with ThreadPoolExecutor(max_workers=2) as executor:
+                    text_future = executor.submit(self._truncate_or_summarize, text)
+                    image_future = executor.submit(self._get_image_from_newsapi, image_query)
+                    text, image_path = text_future.result(), image_future.result()
+            else:
+                text = self._truncate_or_summarize(text)
             
-            if self.config.get("required_text"):
-                text = f"{text}\n\n{self.config['required_text']}"
+            if self.required_text:
+                text = f"{text}\n\n{self.required_text}"
 
             self._post_tweet_in_browser(text, image_path=image_path)
             self._cleanup_temp_image(image_path)
@@ -149,61 +368,102 @@ class HeadlessTwitterAgent:
         if not target: self._log_message("Could not find content to engage with.", "WARN"); return
         
         prompt = self._create_engagement_prompt(target)
-        response_json = self.call_ai_model(prompt)
-        if response_json:
-            try:
-                text = json.loads(response_json).get('tweet_text')
-                if text:
-                    text = self._truncate_or_summarize(text)
-                    if self.config.get("required_text"):
-                        text = f"{text}\n\n{self.config['required_text']}"
-                    self._reply_on_twitter(target['url'], text)
-            except (json.JSONDecodeError, AttributeError):
-                self._log_message("Failed to parse AI JSON for engagement.", "ERROR")
+        response_data = self.call_ai_model(prompt)
+        if response_data:
+            text = response_data.get('tweet_text')
+            if text:
+                text = self._truncate_or_summarize(text)
+                if self.required_text:
+                    text = f"{text}\n\n{self.required_text}"
+                self._reply_on_twitter(target['url'], text)
     
-    def call_ai_model(self, prompt, skip_json_parse=False):
+    def call_ai_model(self, prompt, skip_json_parse=False, use_cache=False):
+        # Only opt-in prompts are cached: re-serving generated tweets/replies would make X reject them as duplicates.
+        key = hashlib.blake2b(prompt.encode('utf-8'), digest_size=16).hexdigest() if use_cache else None
+        text_response = self._ai_cache_get(key) if use_cache else None
+        cached = text_response is not None
+        if not cached: text_response = self._call_ai_model_uncached(prompt)
+        if text_response is None: return None
+        if skip_json_parse: result = text_response
+        else:
+            result = None
+            try:
+                parsed = json.loads(_CODE_FENCE_RE.sub("", text_response))
+                if isinstance(parsed, dict): result = parsed
+            except json.JSONDecodeError: pass
+            if result is None: self._log_message("Failed to parse AI JSON response.", "ERROR"); return None
+        if use_cache and not cached: self._ai_cache_put(key, text_response)
+        return result
+
+    def _call_ai_model_uncached(self, prompt):
         try:
             payload = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
-            api_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent?key={self.secrets['GEMINI_API_KEY']}"
-            req = urllib.request.Request(api_url, headers={'Content-Type': 'application/json'}, data=json.dumps(payload).encode('utf-8'))
-            with urllib.request.urlopen(req, timeout=60) as response: result = json.loads(response.read().decode('utf-8'))
+            self.gemini_bucket.acquire()
+            response = self.http.post(self.GEMINI_API_URL, json=payload, headers=self._gemini_headers, timeout=60)
+            self.gemini_bucket.update_from_headers(response.headers); response.raise_for_status()
+            result = response.json()
             if result.get('candidates') and result['candidates'][0].get('finishReason') != 'SAFETY':
-                text_response = result['candidates'][0]['content']['parts'][0]['text'].strip()
-                return text_response if skip_json_parse else text_response.replace("```json", "").replace("```", "")
+                return result['candidates'][0]['content']['parts'][0]['text'].strip()
         except Exception as e: self._log_message(f"Error calling AI model: {e}", "ERROR")
         return None
 
+    def _ai_cache_get(self, key):
+        try:
+            with self._ai_cache_lock, shelve.open(self.AI_CACHE_FILE) as cache:
+                entry = cache.get(key)
+                if entry and time.time() - entry[0] < self.AI_CACHE_TTL: return entry[1]
+                if entry: del cache[key]  # Stale.
+        except Exception as e: self._log_message(f"Could not read AI cache: {e}", "WARN")
+        return None
+
+    def _ai_cache_put(self, key, text_response):
+        try:
+            with self._ai_cache_lock, shelve.open(self.AI_CACHE_FILE) as cache:
+                # Prune expired entries, then the oldest ones, so the file stays bounded.
+                now = time.time()
+                entries = sorted((cache[k][0], k) for k in cache.keys())
+                stale = [k for stamp, k in entries if now - stamp >= self.AI_CACHE_TTL]
+                fresh = [k for stamp, k in entries if now - stamp < self.AI_CACHE_TTL]
+                for k in stale + fresh[:max(0, len(fresh) - self.AI_CACHE_MAX_ENTRIES + 1)]: del cache[k]
+                cache[key] = (now, text_response)
+        except Exception as e: self._log_message(f"Could not write AI cache: {e}", "WARN")
+
     def _truncate_or_summarize(self, text):
-        if len(text) <= self.TWITTER_CHAR_LIMIT: return text
+        length = _weighted_len(text)
+        if length <= self.TWITTER_CHAR_LIMIT: return text
+        if length <= self.LOCAL_TRUNCATE_LIMIT: return self._truncate_at_sentence(text)
         prompt = f"Summarize the following text to be well under {self.TWITTER_CHAR_LIMIT} characters for a tweet. Keep the original tone and key message.\n\nTEXT:\n---\n{text}"
-        summarized_text = self.call_ai_model(prompt, skip_json_parse=True)
-        if not summarized_text or len(summarized_text) > self.TWITTER_CHAR_LIMIT: return text[:self.TWITTER_CHAR_LIMIT - 3] + "..."
+        summarized_text = self.call_ai_model(prompt, skip_json_parse=True, use_cache=True)
+        if not summarized_text or _weighted_len(summarized_text) > self.TWITTER_CHAR_LIMIT: return _weighted_prefix(text, self.TWITTER_CHAR_LIMIT - 3) + "..."
         return summarized_text
 
+    def _truncate_at_sentence(self, text):
+        head = _weighted_prefix(text, self.TWITTER_CHAR_LIMIT - 3)
+        cut = max(head.rfind(". "), head.rfind("! "), head.rfind("? "))
+        if cut >= 0 and _weighted_len(head[:cut + 1]) >= self.TWITTER_CHAR_LIMIT // 2: return head[:cut + 1]  # Only when the sentence keeps most of the budget.
+        return head + "..."
+
     def _get_generation_function(self, mode):
-        if self.config.get("auto_niche", False): return self._analyze_and_generate_from_global_trends
+        if self.auto_niche: return self._analyze_and_generate_from_global_trends
         source_map = {'strategic_mix': self._analyze_and_generate_from_global_trends, 'post_only_controversy': self._analyze_and_generate_from_global_trends, 'post_only_news': self._generate_from_news_article, 'post_only_word': self._generate_from_word_file}
         return source_map.get(mode)
 
     def _get_image_from_newsapi(self, query):
-        api_key = self.secrets.get("NEWSAPI_KEY")
-        if not api_key: return None
+        if not self.secrets.get("NEWSAPI_KEY"): return None
         try:
-            params = {'q': query, 'apiKey': api_key, 'pageSize': 20, 'language': 'en', 'sortBy': 'relevancy'}
-            req = urllib.request.Request(f"https://newsapi.org/v2/everything?{urllib.parse.urlencode(params)}", headers={'User-Agent': 'Mozilla/5.0'})
-            with urllib.request.urlopen(req, timeout=20) as response: api_data = json.loads(response.read())
-            if api_data.get("status") != "ok" or not api_data.get("articles"): return None
-            articles_with_images = [article for article in api_data["articles"] if article.get("urlToImage")]
-            if not articles_with_images: return None
-            return self._download_image(random.choice(articles_with_images)['urlToImage'])
+            params = {'q': query, 'pageSize': 20, 'language': 'en', 'sortBy': 'relevancy'}
+            image_urls = self._fetch_newsapi_field(params, 'urlToImage')
+            if not image_urls: return None
+            return self._download_image(random.choice(image_urls))
         except Exception as e: self._log_message(f"Error fetching image from NewsAPI: {e}", "ERROR")
         return None
 
     def _download_image(self, image_url):
         try:
             image_path = os.path.join(os.getcwd(), "temp_post_image.jpg")
-            opener = urllib.request.build_opener(); opener.addheaders = [('User-Agent', 'Mozilla/5.0')]; urllib.request.install_opener(opener)
-            urllib.request.urlretrieve(image_url, image_path)
+            with self.http.get(image_url, stream=True, timeout=20) as response:
+                response.raise_for_status(); response.raw.decode_content = True
+                with open(image_path, 'wb') as f: shutil.copyfileobj(response.raw, f, 64 * 1024)
             if os.path.exists(image_path): return image_path
         except Exception as e: self._log_message(f"Failed to download image: {e}", "ERROR")
         return None
@@ -214,109 +474,172 @@ class HeadlessTwitterAgent:
             except Exception as e: self._log_message(f"Could not delete temp image: {e}", "WARN")
 
     def _generate_from_news_article(self):
-        api_key = self.secrets.get("NEWSAPI_KEY"); niche = self.config.get("niche")
-        if not api_key: return None
+        niche = self.niche
         try:
-            params = {'q': niche, 'apiKey': api_key, 'pageSize': 50, 'language': 'en', 'sortBy': 'publishedAt'}
-            api_url = f"https://newsapi.org/v2/everything?{urllib.parse.urlencode(params)}"
-            req = urllib.request.Request(api_url, headers={'User-Agent': 'Mozilla/5.0'})
-            with urllib.request.urlopen(req) as response: api_data = json.loads(response.read())
-            if api_data.get("status") != "ok" or not api_data.get("articles"): return None
-            headline = random.choice(api_data["articles"]).get('title')
-            if not headline: return None
+            headlines = self._fetch_news_headlines(niche)
+            if not headlines: return None
+            headline = random.choice(headlines)
             task = f"Analyze this news headline: '{headline}'. Formulate an insightful tweet about it."
-            prompt = self._create_master_prompt(task, self.config.get("tone"), niche)
-            response_json = self.call_ai_model(prompt)
-            if not response_json: return None
-            text = json.loads(response_json).get('tweet_text')
+            prompt = self._create_master_prompt(task, self.tone, niche)
+            response_data = self.call_ai_model(prompt)
+            if not response_data: return None
+            text = response_data.get('tweet_text')
             return {"text": text, "query_for_image": headline}
         except Exception as e: self._log_message(f"Error in News engine: {e}", "ERROR"); return None
         
-    def _analyze_and_generate_from_global_trends(self):
+    def _fetch_news_headlines(self, query, page_size=50):
+        if not self.secrets.get("NEWSAPI_KEY") or not query: return []
+        params = {'q': query, 'pageSize': page_size, 'language': 'en', 'sortBy': 'publishedAt'}
+        return self._fetch_newsapi_field(params, 'title')
+
+    def _fetch_newsapi_field(self, params, field):
+        """Returns the non-empty `field` of every article, streaming the body with ijson when it is installed."""
+        self.news_bucket.acquire()
+        with self.http.get("https://newsapi.org/v2/everything", params=params, headers=self._news_headers, stream=True, timeout=20) as response:
+            self.news_bucket.update_from_headers(response.headers); response.raise_for_status()
+            if ijson_available:
+                response.raw.decode_content = True
+                return [value for value in ijson.items(response.raw, f'articles.item.{field}') if value]
+            api_data = response.json()
+        if api_data.get("status") != "ok": return []
+        return [article[field] for article in api_data.get("articles") or [] if article.get(field)]
+
+    def _block_heavy_resources(self, enabled):
+        try: self.driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': self.SCRAPE_BLOCKED_URLS if enabled else []})
+        except Exception as e: self._log_message(f"Could not update blocked URLs: {e}", "WARN")
+
+    def _scrape_trends(self):
+        self._block_heavy_resources(True)
         try:
             self.driver.get("https://x.com/explore/tabs/trending")
-            WebDriverWait(self.driver, 20).until(EC.presence_of_element_located((By.XPATH, "//div[@data-testid='trend']"))); time.sleep(3)
-            trends_text_list = [elem.text for elem in self.driver.find_elements(By.XPATH, "//div[@data-testid='trend']") if elem.text]
+            self.wait.until(EC.presence_of_all_elements_located(self.TREND))
+            return self.driver.execute_script(self.TRENDS_JS)
+        finally: self._block_heavy_resources(False)
+
+    def _analyze_and_generate_from_global_trends(self):
+        try:
+            # Fetch fallback headlines while the trends page loads; they are only used if the scrape comes back empty.
+            executor = ThreadPoolExecutor(max_workers=1)
+            news_future = executor.submit(self._fetch_news_headlines, self.niche or "world news", 20)
+            try:
+                trends_text_list = self._scrape_trends()
+            except Exception as e:
+                self._log_message(f"Trend scrape failed, falling back to news headlines: {e}", "WARN")
+                trends_text_list = None
+            if not trends_text_list:
+                try: trends_text_list = news_future.result()
+                except Exception as e: self._log_message(f"Error fetching fallback headlines: {e}", "ERROR")
+            executor.shutdown(wait=False)  # Don't block on the fallback request when the scrape succeeded.
             if not trends_text_list: return None
             trends_blob = "\n".join(trends_text_list)
             task = f"From these trends, find the most interesting one and write an engaging tweet:\n{trends_blob}"
-            prompt = self._create_master_prompt(task, self.config.get("tone"), "Current Events")
-            response_json = self.call_ai_model(prompt)
-            if not response_json: return None
-            text = json.loads(response_json).get('tweet_text')
-            analysis = json.loads(response_json).get('analysis')
+            prompt = self._create_master_prompt(task, self.tone, "Current Events")
+            response_data = self.call_ai_model(prompt)
+            if not response_data: return None
+            text = response_data.get('tweet_text')
+            analysis = response_data.get('analysis')
             return {"text": text, "query_for_image": analysis or text}
         except Exception as e: self._log_message(f"Error in Trend Analysis engine: {e}", "ERROR"); return None
         
     def _generate_from_word_file(self):
-        filepath = self.config.get("word_file_path")
+        filepath = self.word_file_path
         if not filepath or not os.path.exists(filepath): return None
         try:
-            if not docx_available: return None
-            doc = docx.Document(filepath); content = '\n'.join([para.text for para in doc.paragraphs])
-            task = f"Create a compelling tweet that captures the main idea of this text:\n---\n{content[:4000]}"
-            prompt = self._create_master_prompt(task, self.config.get("tone"), "document analysis")
-            response_json = self.call_ai_model(prompt)
-            if not response_json: return None
-            text = json.loads(response_json).get('tweet_text')
+            content = self._read_docx_text(filepath, 4000)
+            task = f"Create a compelling tweet that captures the main idea of this text:\n---\n{content}"
+            prompt = self._create_master_prompt(task, self.tone, "document analysis")
+            response_data = self.call_ai_model(prompt)
+            if not response_data: return None
+            text = response_data.get('tweet_text')
             return {"text": text, "query_for_image": text[:100]}
         except Exception as e: self._log_message(f"Error reading Word file: {e}", "ERROR"); return None
 
+    def _read_docx_text(self, filepath, limit):
+        # Streams text straight out of the .docx XML, stopping once `limit` characters are collected.
+        parts, size, buffer, skip_depth, complete = [], 0, '', 0, False
+        decoder = codecs.getincrementaldecoder('utf-8')('ignore')
+        with zipfile.ZipFile(filepath) as z, z.open('word/document.xml') as f:
+            while size < limit:
+                chunk = f.read(64 * 1024)
+                if not chunk: complete = True; break
+                buffer += decoder.decode(chunk)
+                end = max(buffer.rfind('</w:t>') + 6, buffer.rfind('</w:p>') + 6)
+                if end < 6: continue
+                for match in _DOCX_TOKEN_RE.finditer(buffer, 0, end):
+                    if match.group('close') is not None:
+                        skip_depth += -1 if match.group('close') else 1; continue
+                    if skip_depth: continue
+                    tag = match.group('tag')
+                    if tag is None: text = html.unescape(match.group('text'))
+                    elif tag.startswith('<w:ptab'): text = '\t'
+                    elif tag.startswith('<w:br'): text = '' if 'w:type=' in tag and 'textWrapping' not in tag else '\n'  # Page/column breaks add no text.
+                    else: text = _DOCX_TAG_TEXT[tag]
+                    parts.append(text); size += len(text)
+                buffer = buffer[end:]
+        content = ''.join(parts)
+        if complete and content.endswith('\n'): content = content[:-1]  # Paragraphs are newline-joined, not terminated.
+        return content[:limit]
+
     def _post_tweet_in_browser(self, text, image_path=None):
         try:
             self.driver.get("https://x.com/compose/post")
-            text_area = WebDriverWait(self.driver, 20).until(EC.presence_of_element_located((By.XPATH, '//div[@data-testid="tweetTextarea_0"]')))
+            text_area = self.wait.until(EC.presence_of_element_located(self.TWEET_TEXTAREA))
             if image_path:
-                self.driver.find_element(By.XPATH, "//input[@data-testid='fileInput']").send_keys(image_path)
-                time.sleep(10)
+                self.driver.find_element(*self.FILE_INPUT).send_keys(image_path)
+                self.wait.until(EC.presence_of_element_located(self.ATTACHMENT_IMG))
             text_area.send_keys(text)
-            time.sleep(1)
-            post_button = WebDriverWait(self.driver, 20).until(EC.element_to_be_clickable((By.XPATH, "//button[@data-testid='tweetButton']")))
+            post_button = self.wait.until(EC.element_to_be_clickable(self.TWEET_BTN))
             post_button.click()
-            self._log_message("Tweet sent.", "SUCCESS"); time.sleep(5)
+            self.wait.until(EC.staleness_of(post_button))
+            self._log_message("Tweet sent.", "SUCCESS")
         except Exception as e: self._log_message(f"Error posting on Twitter: {e}", "ERROR")
 
     def _reply_on_twitter(self, url, text):
         try:
             self.driver.get(url)
-            reply_button = WebDriverWait(self.driver, 20).until(EC.element_to_be_clickable((By.XPATH, "(//article[@data-testid='tweet']//button[@data-testid='reply'])[1]")))
+            reply_button = self.wait.until(EC.element_to_be_clickable(self.REPLY_BTN))
             reply_button.click()
-            reply_area = WebDriverWait(self.driver, 10).until(EC.element_to_be_clickable((By.XPATH, '//div[@data-testid="tweetTextarea_0"]')))
-            reply_area.send_keys(text); time.sleep(1)
-            reply_button_final = WebDriverWait(self.driver, 20).until(EC.element_to_be_clickable((By.XPATH, "//button[@data-testid='tweetButton']")))
+            reply_area = self.wait.until(EC.element_to_be_clickable(self.TWEET_TEXTAREA))
+            reply_area.send_keys(text)
+            reply_button_final = self.wait.until(EC.element_to_be_clickable(self.TWEET_BTN))
             reply_button_final.click()
-            self._log_message("Reply sent.", "SUCCESS"); time.sleep(5)
+            self.wait.until(EC.staleness_of(reply_button_final))
+            self._log_message("Reply sent.", "SUCCESS")
         except Exception as e: self._log_message(f"Error replying on Twitter: {e}", "ERROR")
         
     def _find_tweet_to_engage_with(self):
         try:
-            niche = self.config.get("niche", "")
+            niche = self.niche
             search_url = f"https://x.com/search?q={urllib.parse.quote(niche)}&src=typed_query&f=live" if niche else "https://x.com/home"
-            self.driver.get(search_url)
-            WebDriverWait(self.driver, 20).until(EC.presence_of_element_located((By.XPATH, "//article[@data-testid='tweet']"))); time.sleep(2)
-            articles = self.driver.find_elements(By.XPATH, "//article[@data-testid='tweet']")
-            for article in random.sample(articles, min(len(articles), 10)):
-                try:
-                    if "promoted" not in article.text.lower():
-                        return {'author': article.find_element(By.XPATH, ".//div[@data-testid='User-Name']//span[contains(text(), '@')]").text.strip('@'), 'text': article.find_element(By.XPATH, ".//div[@data-testid='tweetText']").text, 'url': article.find_element(By.XPATH, ".//a[contains(@href, '/status/')]").get_attribute('href')}
-                except NoSuchElementException: continue
+            self._block_heavy_resources(True)
+            try:
+                self.driver.get(search_url)
+                self.wait.until(EC.presence_of_all_elements_located(self.ARTICLE))
+                candidates = self.driver.execute_script(self.TWEETS_JS)
+            finally: self._block_heavy_resources(False)
+            # Single-pass reservoir sample (size 1) over the already-filtered candidates.
+            chosen = None
+            for seen, candidate in enumerate(candidates, 1):
+                if random.randrange(seen) == 0: chosen = candidate
+            return chosen
         except Exception as e: self._log_message(f"Error finding tweet: {e}", "ERROR")
         return None
         
     def _create_engagement_prompt(self, target):
-        niche = self.config.get("niche", ""); personality = self.config.get("tone", "Thought Leader")
+        niche = self.niche; personality = self.tone
         task = f"You've found a tweet from @{target['author']} that says: \"{target['text']}\"\nYour task is to write a valuable, insightful reply."
         return self._create_master_prompt(task, personality, niche, is_reply=True)
         
     def _create_master_prompt(self, task, personality, niche, is_reply=False):
         history_context = "\n".join(self.tweet_history) if self.tweet_history else "No recent activity."
-        output_json = '"analysis": "A brief summary.", "tweet_text": "The final tweet text."'
-        if is_reply: output_json = '"analysis": "Justification for your reply.", "tweet_text": "The reply text. DO NOT use @ mentions."'
-        main_task = f"**TASK:** {task}"
-        return f"""**Persona:** You are a '{personality}' expert in '{niche}'.\n**Your Recent Activity:**\n{history_context}\n{main_task}\n**Output Format (Strictly JSON):**\n```json\n{{\n  {output_json}\n}}\n```"""
+        output_json = self._REPLY_OUTPUT if is_reply else self._POST_OUTPUT
+        return self._MASTER_TPL.format(p=personality, n=niche, h=history_context, t=task, o=output_json)
 
     def _shutdown_browser(self):
-        if self.driver: self.driver.quit()
+        if self.driver:
+            try: self.driver.quit()
+            except Exception as e: self._log_message(f"Error while closing browser: {e}", "WARN")
+        self.driver = None; self.wait = None
 
 if __name__ == "__main__":
     try:
@@ -335,7 +658,10 @@ if __name__ == "__main__":
             sys.exit(1)
 
         agent = HeadlessTwitterAgent(config, secrets)
-        agent.run_action_cycle()
+        try:
+            agent.run_action_cycle()
+        finally:
+            agent._shutdown_browser()
 
     except FileNotFoundError:
         print("ERROR: config.json not found. Please create it.")